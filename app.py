@@ -15,13 +15,19 @@ st.caption("Secure, file-driven GST reconciliation for hotels")
 # SAFE IMPORTS (wrapped to avoid silent crashes)
 # --------------------------------------------------
 try:
+    import numpy as np
     import pandas as pd
     import json
     import os
-    import re
-    import time
+    import gc
+    import hashlib
+    import tempfile
+    from concurrent.futures import ProcessPoolExecutor, as_completed
     from io import BytesIO
-    import pdfplumber
+    from gst_parsers import (
+        PDF_FIELDS, safe_number, pdf_page_count, extract_range_totals
+    )
+    from gst_export import reconciliation_xlsx
 except Exception as e:
     st.error("❌ Failed to load required libraries")
     st.exception(e)
@@ -33,9 +39,14 @@ except Exception as e:
 BASE_DIR = os.path.dirname(__file__)
 CONFIG_PATH = os.path.join(BASE_DIR, "gst_reconciliation_config.json")
 
-try:
+@st.cache_resource
+def load_config():
+    """Parse the reconciliation config once per server process"""
     with open(CONFIG_PATH, "r", encoding="utf-8") as f:
-        config = json.load(f)
+        return json.load(f)
+
+try:
+    config = load_config()
 except Exception as e:
     st.error("❌ gst_reconciliation_config.json missing or invalid")
     st.exception(e)
@@ -54,32 +65,249 @@ st.info(
     "Each upload is processed independently."
 )
 
-col1, col2 = st.columns(2)
+# Uploads sit in a form so choosing files does not start a run by itself;
+# only the submit button triggers a rerun with new files
+with st.form("uploads"):
+    col1, col2 = st.columns(2)
 
-with col1:
-    gstr1_file = st.file_uploader(
-        "Upload GSTR-1 Excel / CSV (≤ 10 MB)",
-        type=["xlsx", "csv"]
-    )
+    with col1:
+        gstr1_file = st.file_uploader(
+            "Upload GSTR-1 Excel / CSV (≤ 10 MB)",
+            type=["xlsx", "csv"]
+        )
 
-with col2:
-    gst_pdf_file = st.file_uploader(
-        "Upload GST Export PDF (≤ 300 MB)",
-        type=["pdf"]
-    )
+    with col2:
+        gst_pdf_file = st.file_uploader(
+            "Upload GST Export PDF (≤ 300 MB)",
+            type=["pdf"]
+        )
+
+    submitted = st.form_submit_button("Reconcile")
+
+# Later reruns (e.g. the download click) keep showing the last result
+if submitted:
+    st.session_state["reconcile"] = True
 
-if not gstr1_file or not gst_pdf_file:
-    st.info("⬆️ Upload both files to start reconciliation")
+if not gstr1_file or not gst_pdf_file or not st.session_state.get("reconcile"):
+    st.info("⬆️ Upload both files and press Reconcile to start reconciliation")
     st.stop()
 
+# --------------------------------------------------
+# HELPERS
+# --------------------------------------------------
+SPILL_CHUNK = 4 * 1024 * 1024
+
+def spill_to_tmp(uploaded, limit_mb, suffix):
+    """Stream an upload to a temp file in 4 MB chunks → (path, sha256), path None if over limit"""
+    limit = limit_mb * 1024 * 1024
+    total = 0
+    digest = hashlib.sha256()
+    uploaded.seek(0)
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+        while chunk := uploaded.read(SPILL_CHUNK):
+            total += len(chunk)
+            if total > limit:
+                break
+            tmp.write(chunk)
+            digest.update(chunk)
+    if total > limit:
+        os.unlink(tmp.name)
+        return None, None
+    return tmp.name, digest.hexdigest()
+
+# --------------------------------------------------
+# PARSERS
+# --------------------------------------------------
+META_LABELS = (
+    ("gstin", ("gstin",)),
+    ("hotel", ("legal name", "trade name")),
+    ("period", ("return period",))
+)
+
+def extract_metadata(ws):
+    """Hotel name, GSTIN and return period from the GSTR-1 cover sheet"""
+    meta = dict.fromkeys(("hotel", "gstin", "period"), "Unknown")
+
+    # Read one extra column so every scanned cell has its right-hand value
+    block = np.array(
+        list(ws.iter_rows(max_row=20, max_col=11, values_only=True)),
+        dtype=object
+    ).reshape(-1, 11)
+    cells = np.char.lower(block[:, :10].astype(str))
+    has_value = pd.notna(block[:, 1:])
+
+    for key, labels in META_LABELS:
+        hits = np.zeros(cells.shape, dtype=bool)
+        for label in labels:
+            hits |= np.char.find(cells, label) >= 0
+        found = np.argwhere(hits & has_value)
+        if found.size:
+            # Later matches win, as in a row-by-row scan
+            i, j = found[-1]
+            meta[key] = str(block[i, j + 1]).strip()
+
+    return meta
+
+def summary_row(ws, width):
+    """First `width` values of row 2 of a GSTR-1 section sheet (the totals row)"""
+    row = next(
+        ws.iter_rows(min_row=2, max_row=2, max_col=width, values_only=True),
+        ()
+    )
+    # Short or empty sheets read as blanks rather than raising IndexError
+    return row + (None,) * (width - len(row))
+
+def parse_gstr1_excel(wb):
+    """Summary totals from the hsn / b2b / exemp / atadj sheets"""
+    totals = {
+        "total_taxable_value": 0.0,
+        "b2b_taxable_value": 0.0,
+        "cgst_amount": 0.0,
+        "sgst_amount": 0.0,
+        "igst_amount": 0.0,
+        "total_cess": 0.0,
+        "total_invoice_value": 0.0,
+        "exempted_non_gst": 0.0,
+        "advances_adjusted": 0.0
+    }
+
+    if "hsn" in wb.sheetnames:
+        hsn = summary_row(wb["hsn"], 10)
+        totals["total_invoice_value"] = safe_number(hsn[3])
+        totals["total_taxable_value"] = safe_number(hsn[4])
+        totals["igst_amount"] = safe_number(hsn[6])
+        totals["cgst_amount"] = safe_number(hsn[7])
+        totals["sgst_amount"] = safe_number(hsn[8])
+        totals["total_cess"] = safe_number(hsn[9])
+
+    if "b2b" in wb.sheetnames:
+        b2b = summary_row(wb["b2b"], 12)
+        totals["b2b_taxable_value"] = safe_number(b2b[11])
+
+    if "exemp" in wb.sheetnames:
+        exemp = summary_row(wb["exemp"], 4)
+        totals["exempted_non_gst"] = safe_number(exemp[3])
+
+    if "atadj" in wb.sheetnames:
+        atadj = summary_row(wb["atadj"], 4)
+        totals["advances_adjusted"] = safe_number(atadj[3])
+
+    return totals
+
+@st.cache_data(show_spinner=False, ttl=3600, max_entries=8)
+def process_gstr1(file_bytes):
+    """Open the GSTR-1 workbook once → (metadata, summary totals)"""
+    import openpyxl
+
+    # Read-only streaming: only the rows asked for are ever parsed
+    wb = openpyxl.load_workbook(BytesIO(file_bytes), read_only=True, data_only=True)
+    try:
+        return extract_metadata(wb.worksheets[0]), parse_gstr1_excel(wb)
+    finally:
+        wb.close()
+
+PDF_CHUNKS_PER_WORKER = 4
+# Each worker holds its own copy of the open PDF, so the pool stays small
+# even on hosts that report many CPUs
+PDF_MAX_WORKERS = 4
+
+def usable_cpus():
+    """CPUs this process may run on (honours CPU affinity where available)"""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def parse_gst_pdf(pdf_path, keys, on_progress=None):
+    """Page-parallel scan of the GST export PDF → totals for `keys`"""
+    totals = dict.fromkeys(keys, 0.0)
+
+    total_pages = pdf_page_count(pdf_path)
+
+    # A few page ranges per worker keeps every core busy to the end while
+    # each task opens the PDF only once
+    workers = min(usable_cpus(), PDF_MAX_WORKERS)
+    chunk = max(1, -(-total_pages // (workers * PDF_CHUNKS_PER_WORKER)))
+    ranges = [
+        (start, min(start + chunk, total_pages))
+        for start in range(0, total_pages, chunk)
+    ]
+
+    range_totals = {}
+    pages_done = reported = 0
+    # Never start more processes than there are ranges to hand out
+    with ProcessPoolExecutor(max_workers=max(1, min(workers, len(ranges)))) as executor:
+        futures = {
+            executor.submit(extract_range_totals, pdf_path, start, stop): (start, stop)
+            for start, stop in ranges
+        }
+
+        for future in as_completed(futures):
+            start, stop = futures[future]
+            range_totals[start] = future.result()
+            pages_done += stop - start
+
+            # Each progress update is a websocket message: report at most
+            # once per whole percent
+            percent = pages_done * 100 // total_pages
+            if on_progress and percent > reported:
+                reported = percent
+                on_progress(pages_done / total_pages)
+
+    # Merge in page order so totals do not depend on worker scheduling
+    sums = np.zeros(len(PDF_FIELDS))
+    for start in sorted(range_totals):
+        sums += range_totals[start]
+    totals.update(zip(PDF_FIELDS, sums.tolist()))
+
+    totals["b2b_taxable_value"] = totals["total_taxable_value"]
+    totals["total_invoice_value"] = (
+        totals["total_taxable_value"]
+        + totals["cgst_amount"]
+        + totals["sgst_amount"]
+        + totals["igst_amount"]
+        + totals["total_cess"]
+    )
+
+    return totals
+
+@st.cache_data(show_spinner=False, ttl=3600, max_entries=8)
+def build_recon_df(excel_totals, pdf_totals, components, columns):
+    """Reconciliation table for the configured components"""
+    keys = [comp["key"] for comp in components]
+    # Python round() works from the exact decimal value; np.round scales by
+    # 100 first and can land half a paisa on the wrong side
+    excel_vals = np.array([round(excel_totals.get(key, 0), 2) for key in keys])
+    pdf_vals = np.array([round(pdf_totals.get(key, 0), 2) for key in keys])
+    diffs = np.array([round(d, 2) for d in np.abs(excel_vals - pdf_vals).tolist()])
+    statuses = np.where(diffs == 0, "Matched", "Difference")
+
+    # Column-wise construction: each array becomes one typed column
+    return pd.DataFrame(dict(zip(
+        columns,
+        (
+            [comp["label"] for comp in components],
+            excel_vals,
+            pdf_vals,
+            [comp["logic"] for comp in components],
+            statuses,
+            diffs
+        )
+    )))
+
+@st.cache_data(show_spinner=False, ttl=3600, max_entries=8)
+def build_download(dataframe):
+    return reconciliation_xlsx(dataframe)
+
 # --------------------------------------------------
 # FILE SIZE VALIDATION
 # --------------------------------------------------
-if len(gstr1_file.getbuffer()) / (1024 * 1024) > 10:
+if gstr1_file.size / (1024 * 1024) > 10:
     st.error("❌ Excel file exceeds 10 MB limit")
     st.stop()
 
-if len(gst_pdf_file.getbuffer()) / (1024 * 1024) > 300:
+# Reject oversized PDFs from the reported size before copying anything;
+# the copy to disk in step 2 re-checks the bytes it actually streams
+if gst_pdf_file.size / (1024 * 1024) > 300:
     st.error("❌ PDF file exceeds 300 MB limit")
     st.stop()
 
@@ -94,154 +322,75 @@ progress_bar = st.progress(0)
 status_text = st.empty()
 
 # --------------------------------------------------
-# HELPERS
-# --------------------------------------------------
-def safe_number(value):
-    """Safely convert GST numbers like '₹3,58,42,919.18' → float"""
-    try:
-        value = re.sub(r"[₹,]", "", str(value))
-        return float(value)
-    except Exception:
-        return 0.0
-
+# STEP 1: READ GSTR-1 EXCEL (METADATA + REAL VALUES)
 # --------------------------------------------------
-# STEP 1: EXTRACT METADATA
-# --------------------------------------------------
-status_text.text("🔍 Reading hotel metadata…")
+status_text.text("📊 Reading GSTR-1 Excel…")
 progress_bar.progress(10)
 
-xls = pd.ExcelFile(gstr1_file)
-meta_df = pd.read_excel(xls, sheet_name=xls.sheet_names[0], header=None)
-
-hotel = gstin = period = "Unknown"
-
-rows, cols = meta_df.shape
-for i in range(min(20, rows)):
-    for j in range(min(10, cols)):
-        cell = str(meta_df.iloc[i, j]).lower()
-        if "gstin" in cell and j + 1 < cols:
-            gstin = str(meta_df.iloc[i, j + 1]).strip()
-        if ("legal name" in cell or "trade name" in cell) and j + 1 < cols:
-            hotel = str(meta_df.iloc[i, j + 1]).strip()
-        if "return period" in cell and j + 1 < cols:
-            period = str(meta_df.iloc[i, j + 1]).strip()
-
-progress_bar.progress(25)
-
-# --------------------------------------------------
-# STEP 2: PARSE GSTR-1 EXCEL (REAL VALUES)
-# --------------------------------------------------
-status_text.text("📊 Parsing GSTR-1 Excel…")
-
-excel_totals = {
-    "total_taxable_value": 0.0,
-    "b2b_taxable_value": 0.0,
-    "cgst_amount": 0.0,
-    "sgst_amount": 0.0,
-    "igst_amount": 0.0,
-    "total_cess": 0.0,
-    "total_invoice_value": 0.0,
-    "exempted_non_gst": 0.0,
-    "advances_adjusted": 0.0
-}
-
-if "hsn" in xls.sheet_names:
-    hsn = pd.read_excel(xls, "hsn", header=None)
-    excel_totals["total_invoice_value"] = safe_number(hsn.iloc[1, 3])
-    excel_totals["total_taxable_value"] = safe_number(hsn.iloc[1, 4])
-    excel_totals["igst_amount"] = safe_number(hsn.iloc[1, 6])
-    excel_totals["cgst_amount"] = safe_number(hsn.iloc[1, 7])
-    excel_totals["sgst_amount"] = safe_number(hsn.iloc[1, 8])
-    excel_totals["total_cess"] = safe_number(hsn.iloc[1, 9])
-
-if "b2b" in xls.sheet_names:
-    b2b = pd.read_excel(xls, "b2b", header=None)
-    excel_totals["b2b_taxable_value"] = safe_number(b2b.iloc[1, 11])
-
-if "exemp" in xls.sheet_names:
-    exemp = pd.read_excel(xls, "exemp", header=None)
-    excel_totals["exempted_non_gst"] = safe_number(exemp.iloc[1, 3])
-
-if "atadj" in xls.sheet_names:
-    atadj = pd.read_excel(xls, "atadj", header=None)
-    excel_totals["advances_adjusted"] = safe_number(atadj.iloc[1, 3])
+# Our copy of the upload is only needed for this read; close it so its
+# buffer can be freed instead of living until the end of the run
+try:
+    meta, excel_totals = process_gstr1(gstr1_file.getvalue())
+finally:
+    gstr1_file.close()
+hotel, gstin, period = meta["hotel"], meta["gstin"], meta["period"]
 
 progress_bar.progress(45)
 
 # --------------------------------------------------
-# STEP 3: PARSE GST PDF (PAGE-BY-PAGE)
+# STEP 2: PARSE GST PDF (PAGE-BY-PAGE)
 # --------------------------------------------------
 status_text.text("📄 Parsing GST Export PDF…")
 
-pdf_totals = dict.fromkeys(excel_totals.keys(), 0.0)
-
-with pdfplumber.open(gst_pdf_file) as pdf:
-    total_pages = len(pdf.pages)
-    for idx, page in enumerate(pdf.pages):
-        text = page.extract_text() or ""
-
-        pdf_totals["total_taxable_value"] += safe_number(
-            re.search(r"taxable value\s*([\d,\.]+)", text, re.I).group(1)
-            if re.search(r"taxable value\s*([\d,\.]+)", text, re.I)
-            else 0
-        )
-        pdf_totals["cgst_amount"] += safe_number(
-            re.search(r"cgst\s*([\d,\.]+)", text, re.I).group(1)
-            if re.search(r"cgst\s*([\d,\.]+)", text, re.I)
-            else 0
-        )
-        pdf_totals["sgst_amount"] += safe_number(
-            re.search(r"sgst\s*([\d,\.]+)", text, re.I).group(1)
-            if re.search(r"sgst\s*([\d,\.]+)", text, re.I)
-            else 0
-        )
-        pdf_totals["igst_amount"] += safe_number(
-            re.search(r"igst\s*([\d,\.]+)", text, re.I).group(1)
-            if re.search(r"igst\s*([\d,\.]+)", text, re.I)
-            else 0
-        )
-        pdf_totals["total_cess"] += safe_number(
-            re.search(r"cess\s*([\d,\.]+)", text, re.I).group(1)
-            if re.search(r"cess\s*([\d,\.]+)", text, re.I)
-            else 0
-        )
-
-        progress_bar.progress(45 + int((idx + 1) / total_pages * 40))
-
-pdf_totals["b2b_taxable_value"] = pdf_totals["total_taxable_value"]
-pdf_totals["total_invoice_value"] = (
-    pdf_totals["total_taxable_value"]
-    + pdf_totals["cgst_amount"]
-    + pdf_totals["sgst_amount"]
-    + pdf_totals["igst_amount"]
-    + pdf_totals["total_cess"]
-)
+# parse_gst_pdf drives the progress bar, which st.cache_data would replay
+# against a stale element, so its result is memoised in session state.
+# A rerun with the same upload (e.g. the download click) is recognised by
+# its file_id and size without reading a byte; only a new upload is spilled
+# and hashed, and a re-upload of identical content still hits on digest.
+upload_key = (gst_pdf_file.file_id, gst_pdf_file.size)
+cached_pdf = st.session_state.get("pdf_totals")
+
+if cached_pdf and cached_pdf[0] == upload_key:
+    pdf_totals = cached_pdf[2]
+    gst_pdf_file.close()
+else:
+    # The PDF is spilled to disk only now, right before it is parsed, and
+    # the temp file is removed whatever happens from here on. After the
+    # spill only that file is read, so the in-memory upload is closed.
+    pdf_path, pdf_digest = spill_to_tmp(gst_pdf_file, 300, ".pdf")
+    try:
+        gst_pdf_file.close()
+        if pdf_path is None:
+            st.error("❌ PDF file exceeds 300 MB limit")
+            st.stop()
+
+        if cached_pdf and cached_pdf[1] == pdf_digest:
+            pdf_totals = cached_pdf[2]
+        else:
+            pdf_totals = parse_gst_pdf(
+                pdf_path,
+                excel_totals.keys(),
+                on_progress=lambda frac: progress_bar.progress(45 + int(frac * 40))
+            )
+        st.session_state["pdf_totals"] = (upload_key, pdf_digest, pdf_totals)
+    finally:
+        if pdf_path is not None:
+            os.unlink(pdf_path)
+        gc.collect()
 
 progress_bar.progress(90)
 
 # --------------------------------------------------
-# STEP 4: BUILD RECON TABLE
+# STEP 3: BUILD RECON TABLE
 # --------------------------------------------------
 status_text.text("🧮 Building reconciliation…")
 
-rows = []
-for comp in config["reconciliation_components"]:
-    key = comp["key"]
-    ev = round(excel_totals.get(key, 0), 2)
-    pv = round(pdf_totals.get(key, 0), 2)
-    diff = round(abs(ev - pv), 2)
-    status = "Matched" if diff == 0 else "Difference"
-
-    rows.append([
-        comp["label"],
-        ev,
-        pv,
-        comp["logic"],
-        status,
-        diff
-    ])
-
-df = pd.DataFrame(rows, columns=config["output_table"]["columns"])
+df = build_recon_df(
+    excel_totals,
+    pdf_totals,
+    config["reconciliation_components"],
+    config["output_table"]["columns"]
+)
 
 progress_bar.progress(100)
 status_text.text("✅ Reconciliation completed")
@@ -262,12 +411,6 @@ st.dataframe(df, use_container_width=True)
 # --------------------------------------------------
 # DOWNLOAD
 # --------------------------------------------------
-def build_download(dataframe):
-    buffer = BytesIO()
-    with pd.ExcelWriter(buffer, engine="openpyxl") as writer:
-        dataframe.to_excel(writer, index=False, sheet_name="Reconciliation")
-    return buffer.getvalue()
-
 st.download_button(
     "⬇️ Download Reconciliation Excel",
     data=build_download(df),
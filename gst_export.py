@@ -0,0 +1,15 @@
+"""Download builders shared by app.py and its checks.
+
+Kept free of Streamlit so the workbook output can be verified without
+running the app script.
+"""
+from io import BytesIO
+
+import pandas as pd
+
+def reconciliation_xlsx(dataframe):
+    """Reconciliation table → .xlsx bytes (single "Reconciliation" sheet)"""
+    buffer = BytesIO()
+    with pd.ExcelWriter(buffer, engine="xlsxwriter") as writer:
+        dataframe.to_excel(writer, index=False, sheet_name="Reconciliation")
+    return buffer.getvalue()
@@ -0,0 +1,181 @@
+"""Parsing helpers shared by app.py and its PDF worker processes.
+
+Kept free of Streamlit so ProcessPoolExecutor workers can import it
+without re-running the app script.
+"""
+import gc
+import re
+
+import numpy as np
+
+# RE2 (google-re2) runs these linear patterns as a DFA. The stdlib engine
+# is the fallback, but it is not equivalent: RE2's \s, \d and \b are
+# ASCII-only while re's are Unicode. Patterns here spell out any
+# non-ASCII class they need, and re is compiled with re.ASCII, so both
+# engines match the same text.
+try:
+    import re2
+except ImportError:
+    re2 = None
+
+try:
+    import pypdfium2 as pdfium
+except ImportError:
+    pdfium = None
+
+def compile_pattern(pattern):
+    """Compile with RE2 when installed, with re for anything RE2 rejects"""
+    if re2 is not None:
+        try:
+            return re2.compile(pattern)
+        except re2.error:
+            pass
+    return re.compile(pattern, re.ASCII)
+
+# --------------------------------------------------
+# NUMBERS
+# --------------------------------------------------
+# Characters dropped before float(): rupee sign, digit grouping, stray spaces
+STRIP_TABLE = str.maketrans("", "", "₹, \t")
+
+def safe_number(value):
+    """Safely convert GST numbers like '₹3,58,42,919.18' → float"""
+    # openpyxl hands blank cells over as None and numeric cells as
+    # int / float, so neither needs the str() / float() round-trip
+    if value is None:
+        return 0.0
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return 0.0 if value != value else float(value)
+    try:
+        value = str(value).translate(STRIP_TABLE)
+        return float(value)
+    except Exception:
+        return 0.0
+
+# --------------------------------------------------
+# PDF AMOUNTS
+# --------------------------------------------------
+PDF_LABEL_KEYS = {
+    "taxable value": "total_taxable_value",
+    "cgst": "cgst_amount",
+    "sgst": "sgst_amount",
+    "igst": "igst_amount",
+    "cess": "total_cess"
+}
+PDF_KEYWORDS = tuple(PDF_LABEL_KEYS)
+PDF_FIELDS = tuple(PDF_LABEL_KEYS.values())
+
+# Whitespace between a label and its amount, as re's Unicode \s would
+# match it; PDFs often set these with NBSP or thin spaces.
+PDF_SPACE = ("[\t\n\x0b\x0c\r\x1c-\x1f \x85\xa0\u1680\u2000-\u200a"
+             "\u2028\u2029\u202f\u205f\u3000]")
+
+# One alternation for all PDF labels, so each page is scanned once. Each
+# branch is a group named after its totals key wrapping the amount group,
+# so a match carries its key in m.lastgroup and its amount in the group
+# right after it. Labels are anchored at a word boundary so e.g. "excess"
+# is not read as "cess". (Case-insensitivity is inline so the pattern
+# compiles on either engine.)
+PDF_AMOUNT_RE = compile_pattern("(?i)" + "|".join(
+    rf"(?P<{key}>\b{label}{PDF_SPACE}*₹?{PDF_SPACE}*([0-9][0-9,]*(?:\.[0-9]+)?))"
+    for label, key in PDF_LABEL_KEYS.items()
+))
+
+def pdf_page_amounts(text):
+    """First amount found for each PDF label on a page → {totals key: str}
+
+    Amounts come back as plain digit strings (separators stripped) so a
+    worker can convert a whole range's values to float in one NumPy pass.
+    """
+    found = {}
+    # Cover, legend and blank pages carry no label: skip the regex on them
+    lowered = text.lower()
+    if not any(kw in lowered for kw in PDF_KEYWORDS):
+        return found
+    for m in PDF_AMOUNT_RE.finditer(text):
+        key = m.lastgroup
+        if key not in found:
+            found[key] = m.group(m.lastindex + 1).translate(STRIP_TABLE)
+    return found
+
+# --------------------------------------------------
+# PDF TEXT
+# --------------------------------------------------
+# pypdfium2 wraps PDFium's C++ text extractor, which is far faster than
+# pdfplumber's pure-Python layout pass. pdfplumber (and pdfminer.six under
+# it) is the heaviest import in the app, so it is only loaded when
+# pypdfium2 is unavailable and a PDF actually has to be read.
+def pdf_page_count(path):
+    """Number of pages in the PDF at `path`"""
+    if pdfium is not None:
+        pdf = pdfium.PdfDocument(path)
+        try:
+            return len(pdf)
+        finally:
+            pdf.close()
+
+    import pdfplumber
+
+    with pdfplumber.open(path) as pdf:
+        return len(pdf.pages)
+
+# Worker processes live for the whole PDF; collect every N pages so
+# pdfium / pdfminer garbage does not accumulate across a long range
+GC_EVERY_PAGES = 50
+
+def iter_page_text(path, start, stop):
+    """Yield (page index, text) for pages [start, stop) of the PDF at `path`
+
+    The single place that opens a PDF for reading text: the document is
+    opened once for the whole range and each page is released as soon as
+    its text has been handed out.
+    """
+    if pdfium is not None:
+        pdf = pdfium.PdfDocument(path)
+        try:
+            for idx in range(start, stop):
+                page = pdf[idx]
+                textpage = page.get_textpage()
+                text = textpage.get_text_range()
+                textpage.close()
+                page.close()
+                yield idx, text
+                if (idx + 1) % GC_EVERY_PAGES == 0:
+                    gc.collect()
+        finally:
+            pdf.close()
+        return
+
+    import pdfplumber
+
+    # No pdfminer layout analysis (laparams=None), and the simple extractor
+    # only collates chars into lines, skipping word grouping. Page.close()
+    # below is why requirements.txt pins pdfplumber>=0.11.
+    with pdfplumber.open(
+        path,
+        pages=list(range(start + 1, stop + 1)),
+        laparams=None
+    ) as pdf:
+        for idx, page in enumerate(pdf.pages, start=start):
+            text = page.extract_text_simple() or ""
+            # Drop the parsed char/line objects and the cached text map
+            page.close()
+            yield idx, text
+            if (idx + 1) % GC_EVERY_PAGES == 0:
+                gc.collect()
+
+def extract_range_totals(path, start, stop):
+    """Worker: scan pages [start, stop) of the PDF at `path` → field totals
+
+    Returns a float64 vector ordered as PDF_FIELDS, so the caller merges
+    worker results with a plain array add.
+    """
+    raw = {key: [] for key in PDF_FIELDS}
+    for _, text in iter_page_text(path, start, stop):
+        for key, amount in pdf_page_amounts(text).items():
+            raw[key].append(amount)
+
+    # One float64 conversion + sum per field instead of one float() per match
+    return np.array([
+        np.asarray(raw[key], dtype=np.float64).sum() for key in PDF_FIELDS
+    ])
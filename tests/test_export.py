@@ -0,0 +1,45 @@
+"""The download workbook must read back exactly as the reconciliation table"""
+import json
+from io import BytesIO
+from pathlib import Path
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+openpyxl = pytest.importorskip("openpyxl")
+pytest.importorskip("xlsxwriter")
+
+from gst_export import reconciliation_xlsx
+
+CONFIG = json.loads(
+    (Path(__file__).resolve().parent.parent / "gst_reconciliation_config.json")
+    .read_text(encoding="utf-8")
+)
+
+def recon_table():
+    components = CONFIG["reconciliation_components"]
+    rows = [
+        (
+            comp["label"],
+            1000.0 + i,
+            1000.0 + i - (i % 2) * 0.5,
+            comp["logic"],
+            "Matched" if i % 2 == 0 else "Difference",
+            (i % 2) * 0.5
+        )
+        for i, comp in enumerate(components)
+    ]
+    return pd.DataFrame(rows, columns=CONFIG["output_table"]["columns"])
+
+def test_download_round_trips_every_cell():
+    df = recon_table()
+
+    wb = openpyxl.load_workbook(BytesIO(reconciliation_xlsx(df)), read_only=True)
+    try:
+        assert wb.sheetnames == ["Reconciliation"]
+        header, *rows = wb["Reconciliation"].iter_rows(values_only=True)
+    finally:
+        wb.close()
+
+    assert list(header) == list(df.columns)
+    assert [list(row) for row in rows] == df.values.tolist()